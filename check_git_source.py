@@ -0,0 +1,64 @@
+import os
+import tempfile
+
+import git
+
+from chunker import Chunker, ChunkingMode
+from git_source import shallow_clone_or_fetch, list_blobs
+
+
+class NoEmbedder:
+    # stands in for Embedder: CHARS mode never counts tokens, and Chunker only loads a tokenizer when embedder is None
+    def get_token_usage(self, text: str) -> int:
+        raise AssertionError("CHARS chunking shouldn't count tokens")
+
+
+def commit_file(work_repo: git.Repo, name: str, content: str) -> None:
+    with open(os.path.join(work_repo.working_dir, name), "w") as f:
+        f.write(content)
+    work_repo.git.add(name)
+    work_repo.git.commit("-m", f"add {name}")
+
+
+def run_checks(directory: str) -> None:
+    # source repository with two commits, published to a local bare repository
+    work_repo = git.Repo.init(os.path.join(directory, "work"))
+    work_repo.git.config("user.name", "check")
+    work_repo.git.config("user.email", "check@example.com")
+    commit_file(work_repo, "a.py", "def a():\n    return 1\n")
+    commit_file(work_repo, "b.py", "def b():\n    return 2\n")
+    origin_path = os.path.join(directory, "origin.git")
+    git.Repo.clone_from(work_repo.working_dir, origin_path, bare=True).close()
+
+    clone_path = os.path.join(directory, "clone")
+    with shallow_clone_or_fetch(origin_path, clone_path) as repo:
+        assert repo.bare, "clone should be bare"
+        assert len(list(repo.iter_commits())) == 1, "clone should hold only the latest commit"
+        assert [file for file, _ in list_blobs(repo)] == ["a.py", "b.py"]
+
+        chunker = Chunker(ChunkingMode.CHARS, chunk_size=720, chunk_overlap=240, embedder=NoEmbedder(), encoding="UTF-8")
+        chunks = list(chunker.chunk_git_objects(repo, path="repo"))
+        assert {chunk["metadata"]["filename"] for chunk in chunks} == {"repo/a.py", "repo/b.py"}
+        assert all(chunk["chunk"].startswith(chunk["metadata"]["filename"] + "\n") for chunk in chunks)
+
+        blob_shas = dict(list_blobs(repo))
+        assert all(chunk["metadata"]["blob-sha"] == blob_shas[chunk["metadata"]["filename"][5:]] for chunk in chunks)
+
+        skipped = list(chunker.chunk_git_objects(repo, path="repo", skip_blobs={blob_shas["a.py"]}))
+        assert {chunk["metadata"]["filename"] for chunk in skipped} == {"repo/b.py"}
+
+    # a new commit is picked up by fetching into the existing clone
+    commit_file(work_repo, "c.py", "def c():\n    return 3\n")
+    work_repo.git.push(origin_path, "HEAD")
+    with shallow_clone_or_fetch(origin_path, clone_path) as repo:
+        assert repo.head.commit.hexsha == work_repo.head.commit.hexsha, "fetch should move HEAD to the new commit"
+        assert [file for file, _ in list_blobs(repo)] == ["a.py", "b.py", "c.py"]
+
+    work_repo.close()
+
+
+if __name__ == "__main__":
+    # runs offline: the repositories are local and CHARS chunking doesn't load a tokenizer
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        run_checks(temporary_directory)
+    print("All git source checks passed.")
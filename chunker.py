@@ -1,9 +1,13 @@
+import io
 import os
 from enum import Enum
-from charset_normalizer import from_path
+from charset_normalizer import from_bytes, from_path
 from transformers import AutoTokenizer
 
+import git
+
 from embedder import Embedder
+from git_source import list_blobs, read_blob
 
 
 class ChunkingMode(Enum):
@@ -143,14 +147,18 @@ class Chunker:
             chunk_index += 1
 
 
+    def __chunk_stream(self, filename: str, stream):
+        if self.chunking_mode == ChunkingMode.LINES:
+            yield from self.__chunk_lines(filename, stream.readlines())
+        elif self.chunking_mode == ChunkingMode.CHARS:
+            yield from self.__chunk_text(filename, stream.read())
+
+
     def __yield_chunks(self, root: str, filename: str, encoding: str):
         file = os.path.join(root, filename)
         with open(file, "r", encoding=encoding) as f:
             file = file.replace("\\", "/")
-            if self.chunking_mode == ChunkingMode.LINES:
-                yield from self.__chunk_lines(file, f.readlines())
-            elif self.chunking_mode == ChunkingMode.CHARS:
-                yield from self.__chunk_text(file, f.read())
+            yield from self.__chunk_stream(file, f)
 
 
     def __try_with_another_encoding(self, root: str, file: str):
@@ -182,3 +190,33 @@ class Chunker:
                     results = self.__try_with_another_encoding(root, file)
                     if results is not None:
                         yield from results
+
+
+    def __decode_blob(self, data: bytes) -> str | None:
+        try:
+            return data.decode(self.__file_encoding)
+
+        except (UnicodeDecodeError, UnicodeError):
+            result = from_bytes(data).best()
+            if result is None or result.encoding == self.__file_encoding: return None
+            return str(result)
+
+
+    def chunk_git_objects(self, repo: git.Repo, path: str, revision: str = "HEAD", skip_blobs: set[str] = frozenset()):
+        """
+        Chunks files of `revision` straight from the git object database, no working tree needed.
+        Chunks are named `path/<file>`, the same as chunk_repo(path) names them, and carry the blob sha in metadata;
+        blobs listed in `skip_blobs` (e.g. already indexed ones) aren't read at all.
+        """
+        for file, sha in list_blobs(repo, revision):
+            if sha in skip_blobs or not self.__is_file_allowed(file): continue
+            filename = os.path.join(path, file).replace("\\", "/")
+            if self.__debug: print(f"chunking blob {sha} {filename}")
+
+            content = self.__decode_blob(read_blob(repo, sha))
+            if content is None: continue
+
+            # newline=None translates line endings the same way open() does for files in the working tree
+            for chunk in self.__chunk_stream(filename, io.StringIO(content, newline=None)):
+                chunk["metadata"]["blob-sha"] = sha
+                yield chunk
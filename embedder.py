@@ -24,3 +24,14 @@ class Embedder:
             outputs = self.__model(**tokens)
         embeddings = outputs.last_hidden_state.mean(dim=1).squeeze()
         return embeddings.cpu().numpy()
+
+    def embed_texts(self, texts: list[str]):
+        tokens = self.__tokenizer(texts, return_tensors="pt", truncation=True, padding=True,
+                                  max_length=512).to(self.__device)
+        if self.__debug: print(f"embedding batch of {len(texts)} chunks")
+        with torch.no_grad():
+            outputs = self.__model(**tokens)
+        # padding tokens are masked out so every row matches what embed_text gives for the same text
+        mask = tokens["attention_mask"].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+        embeddings = (outputs.last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1)
+        return embeddings.cpu().numpy().astype(np.float32)
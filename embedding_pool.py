@@ -0,0 +1,208 @@
+import os
+import queue
+import sys
+import time
+import traceback
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+from transformers import AutoTokenizer
+
+
+def _worker_main(model_name: str, threads: int, tasks, results, debug: bool):
+    """Worker process loop: owns one Embedder and writes its rows straight into the shared matrix."""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+
+        from embedder import Embedder
+        embedder = Embedder(model_name=model_name, debug=debug)
+        embedder.embed_texts(["sample code"] * 8)  # warm-up, so the first real batch isn't slower than the rest
+        results.put(("ready", embedder.embed_text("sample code").shape[0]))
+    except Exception:
+        results.put(("error", traceback.format_exc()))
+        return
+
+    while True:
+        task = tasks.get()
+        if task is None: break
+
+        shm_name, shape, indices, texts = task
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            try:
+                output = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+                output[indices] = embedder.embed_texts(texts)
+                del output  # buffer must be released before closing the segment
+            finally:
+                shm.close()
+            results.put(("done", len(indices)))
+        except Exception:
+            results.put(("error", traceback.format_exc()))
+
+
+class EmbeddingPool:
+    """
+    Pool of worker processes, each running its own Embedder with a fixed number of torch threads.
+
+    Texts are sorted by token count and packed into batches of roughly equal padded size,
+    so every batch costs about the same and short chunks aren't padded up to long ones.
+    Workers write their vectors into a shared float32 matrix instead of sending them back through a pipe.
+    """
+
+    RESULT_POLL_INTERVAL: float = 1.0  # seconds between checks that every worker is still alive
+
+    def __init__(self, workers: int = 4, threads_per_worker: int = None, model_name: str = "microsoft/codebert-base",
+                 max_batch_tokens: int = 8192, debug: bool = False) -> None:
+        self.__workers_count = max(1, workers)
+        self.__threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.__workers_count)
+        self.__max_batch_tokens = max_batch_tokens
+        self.__tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.__debug = debug
+        self.__closed = False
+
+        context = mp.get_context("spawn")  # forking a process that already holds torch state is unsafe
+        self.__tasks = context.Queue()
+        self.__results = context.Queue()
+        self.__processes = [
+            context.Process(
+                target=_worker_main,
+                args=(model_name, self.__threads_per_worker, self.__tasks, self.__results, debug),
+                daemon=True,
+            )
+            for _ in range(self.__workers_count)
+        ]
+        for process in self.__processes:
+            process.start()
+
+        self.__dimension: int = 0
+        for _ in self.__processes:
+            self.__dimension = self.__receive()
+
+        if self.__debug:
+            print(f"Embedding pool started: {self.__workers_count} workers x {self.__threads_per_worker} threads")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    @property
+    def dimension(self) -> int:
+        return self.__dimension
+
+    @property
+    def workers(self) -> int:
+        return self.__workers_count
+
+    def __receive(self):
+        while True:
+            try:
+                status, payload = self.__results.get(timeout=self.RESULT_POLL_INTERVAL)
+                break
+            except queue.Empty:
+                # a worker killed by the OS (OOM, signal) never answers, so waiting any longer would hang forever
+                dead = [process.pid for process in self.__processes if not process.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"Embedding worker(s) {dead} exited unexpectedly")
+
+        if status == "error":
+            self.close()
+            raise RuntimeError(f"Embedding worker failed:\n{payload}")
+        return payload
+
+    def __make_batches(self, texts: list[str]) -> list[list[int]]:
+        token_counts = [
+            len(ids) for ids in self.__tokenizer(texts, truncation=True, max_length=512)["input_ids"]
+        ]
+        order = sorted(range(len(texts)), key=lambda i: token_counts[i])
+
+        batches: list[list[int]] = []
+        batch: list[int] = []
+        for i in order:
+            # texts are sorted ascending, so the current text sets the padded length of the whole batch
+            if batch and (len(batch) + 1) * token_counts[i] > self.__max_batch_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch: batches.append(batch)
+
+        return batches
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed texts in parallel.
+
+        Returns:
+            float32 matrix with one row per text, in the order of the input
+        """
+        if self.__closed: raise RuntimeError("Embedding pool is closed")
+        if not texts: return np.empty((0, self.__dimension), dtype=np.float32)
+
+        shape = (len(texts), self.__dimension)
+        shm = shared_memory.SharedMemory(create=True, size=shape[0] * shape[1] * 4)
+        try:
+            batches = self.__make_batches(texts)
+            for batch in batches:
+                self.__tasks.put((shm.name, shape, batch, [texts[i] for i in batch]))
+
+            for _ in batches:
+                self.__receive()
+
+            return np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self) -> None:
+        self.__closed = True
+        for process in self.__processes:
+            if process.is_alive(): self.__tasks.put(None)
+        for process in self.__processes:
+            process.join(timeout=10)
+            if process.is_alive(): process.terminate()
+        self.__processes = []
+
+
+def report_scaling(texts: list[str], worker_counts: list[int], model_name: str = "microsoft/codebert-base") -> None:
+    """Print embeddings/sec for each worker count; process startup, model loading and warm-up are not timed."""
+    print(f"{'workers':>8} {'threads':>8} {'seconds':>10} {'emb/sec':>10} {'speedup':>8}")
+
+    baseline = None
+    for workers in worker_counts:
+        with EmbeddingPool(workers=workers, model_name=model_name) as pool:  # every worker warms up before it's ready
+            start = time.perf_counter()
+            pool.embed_texts(texts)
+            elapsed = time.perf_counter() - start
+
+        rate = len(texts) / elapsed
+        if baseline is None: baseline = rate
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        print(f"{workers:>8} {threads:>8} {elapsed:>10.2f} {rate:>10.1f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    # usage: python embedding_pool.py [repo path] [max workers]
+    from chunker import Chunker, ChunkingMode
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "repo"
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+
+    chunker = Chunker(ChunkingMode.CHARS, chunk_size=720, chunk_overlap=240, embedder=None,
+                      chunk_all_files=True, encoding="UTF-8")
+    sample = [record["chunk"] for record in chunker.chunk_repo(path)]
+    if not sample:
+        print(f"No chunks found in {path}")
+        exit(1)
+
+    counts = []
+    workers = 1
+    while workers <= max_workers:
+        counts.append(workers)
+        workers *= 2
+
+    print(f"Embedding {len(sample)} chunks from {path}")
+    report_scaling(sample, counts)
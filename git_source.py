@@ -0,0 +1,57 @@
+import os
+from pathlib import Path
+
+import git
+
+from utilities import remove_directory
+
+
+SYMLINK_MODE: int = 0o120000
+
+
+def as_clone_url(url: str) -> str:
+    # git ignores --depth for plain local paths, file:// urls are cloned shallowly like remote ones
+    if os.path.isdir(url): return Path(url).resolve().as_uri()
+    return url
+
+
+def is_repository(path: str) -> bool:
+    # checked by hand, because git would happily find a repository in one of the parent directories
+    return os.path.isdir(os.path.join(path, ".git")) or os.path.isfile(os.path.join(path, "HEAD"))
+
+
+def shallow_clone_or_fetch(url: str, path: str, branch: str | None = None) -> git.Repo:
+    """
+    Makes `path` hold only the latest commit of `url`, without checking any files out.
+
+    An existing bare clone of the same url is updated with a depth 1 fetch and its HEAD moved to the fetched commit;
+    otherwise the repository is cloned bare with depth 1 and a single branch.
+    """
+    if is_repository(path):
+        repo = git.Repo(path)
+        # a working-tree clone (e.g. left by a run without --git-objects) would keep its checked out files and index
+        if repo.bare and "origin" in repo.remotes and repo.remotes.origin.url == as_clone_url(url):
+            repo.git.fetch("origin", branch or "HEAD", depth=1)
+            repo.git.update_ref("HEAD", "FETCH_HEAD")
+            return repo
+        repo.close()
+
+    remove_directory(path)  # clone of another repository, a working-tree clone or some leftovers
+
+    options = {"branch": branch} if branch else {}
+    return git.Repo.clone_from(as_clone_url(url), to_path=path, bare=True, depth=1, single_branch=True, **options)
+
+
+def list_blobs(repo: git.Repo, revision: str = "HEAD") -> list[tuple[str, str]]:
+    """Returns (path, blob sha) of every regular file in the tree of `revision`."""
+    return [
+        (item.path, item.hexsha)
+        for item in repo.commit(revision).tree.traverse()
+        if item.type == "blob" and item.mode != SYMLINK_MODE
+    ]
+
+
+def read_blob(repo: git.Repo, sha: str) -> bytes:
+    # served by a single long-running `git cat-file --batch` process that GitPython keeps per repo
+    _, _, _, data = repo.git.get_object_data(sha)
+    return data
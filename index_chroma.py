@@ -1,17 +1,25 @@
 import chromadb
+import json
+import numpy as np
 import os
 from chromadb.api.types import IncludeEnum
 from chromadb.utils import embedding_functions
 
 from embedder import Embedder
+from embedding_pool import EmbeddingPool
+from projection import Projection, PendingEmbeddings
 
 
 class ChromaIndex:
     def __init__(self, embedding_model: str | Embedder = "all-MiniLM-L6-v2", persist_directory: str = "chroma_database",
-                 debug: bool = False):
+                 debug: bool = False, projection_dimension: int = None):
 
         self.__client = chromadb.PersistentClient(path=persist_directory)
         self.__debug = debug
+        self.__projection: Projection | None = None
+        self.__pending: PendingEmbeddings | None = None  # embeddings held back until the projection is trained
+        self.__projection_path = os.path.join(persist_directory, "projection.bin")
+        self.__pending_records_path = os.path.join(persist_directory, "pending_records.jsonl")
 
         if not isinstance(embedding_model, Embedder):
             self.__built_in_embeddings = True
@@ -47,6 +55,26 @@ class ChromaIndex:
                 metadata={"hnsw:space": "cosine"}
             )
 
+            # an existing collection keeps the projection it was built with, a new one gets the requested one
+            if os.path.exists(self.__projection_path):
+                self.__projection = Projection(0, 0, self.__projection_path, debug=debug)
+            elif projection_dimension is not None and self.__collection.count() == 0:
+                dimension = self.__embedder.embed_text("sample code").shape[0]
+                self.__projection = Projection(dimension, projection_dimension, self.__projection_path, debug=debug)
+                self.__projection.save()  # saved untrained, so records held back for it are picked up when reopened
+                if os.path.exists(self.__pending_records_path):
+                    os.remove(self.__pending_records_path)  # leftovers of a collection deleted without its files
+
+            # records held back before the index was last closed are kept, as many as have both record and embedding
+            if self.__projection is not None and not self.__projection.is_trained:
+                self.__pending = PendingEmbeddings(os.path.join(persist_directory, "pending_embeddings.f32"),
+                                                   self.__projection.training_size)
+                self.__truncate_pending_records(len(self.__pending))
+                self.__pending.truncate(self.__pending_record_count())
+
+        if projection_dimension is not None and self.__built_in_embeddings:
+            print("Projection isn't supported with built-in embeddings. Storing full embeddings.")
+
         self.__record_count = self.__collection.count() + 1
 
     def get_record_count(self):
@@ -59,25 +87,130 @@ class ChromaIndex:
                 metadatas=[record["metadata"]],
                 ids=[str(self.__record_count)]
             )
+            self.__record_count += 1
         else:
             embeddings = self.__embedder.embed_text(record["chunk"])
+            self.__add_embedded([record], embeddings.reshape(1, -1))
+
+    def __store(self, records: list[dict[str, str | dict[str, str | int]]], embeddings: np.ndarray):
+        # chroma rejects adds larger than the max batch size of its backend
+        batch_size = self.__client.get_max_batch_size()
 
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
             self.__collection.add(
-                embeddings=[embeddings],
-                documents=[record["chunk"]],
-                metadatas=[record["metadata"]],
-                ids=[str(self.__record_count)]
+                embeddings=list(embeddings[start:start + batch_size]),
+                documents=[record["chunk"] for record in batch],
+                metadatas=[record["metadata"] for record in batch],
+                ids=[str(self.__record_count + i) for i in range(len(batch))]
             )
 
-        self.__record_count += 1
+            self.__record_count += len(batch)
+
+    def __pending_record_count(self) -> int:
+        if not os.path.exists(self.__pending_records_path): return 0
+        with open(self.__pending_records_path, "r", encoding="utf-8") as f:
+            return sum(1 for line in f if line.endswith("\n"))
+
+    def __truncate_pending_records(self, count: int):
+        if not os.path.exists(self.__pending_records_path): return
+        with open(self.__pending_records_path, "r", encoding="utf-8") as f:
+            lines = [line for line in f if line.endswith("\n")][:count]
+        with open(self.__pending_records_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    def __pending_record_batches(self, batch_size: int):
+        with open(self.__pending_records_path, "r", encoding="utf-8") as f:
+            batch = []
+            for line in f:
+                batch.append(json.loads(line))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch: yield batch
+
+    def __add_embedded(self, records: list[dict[str, str | dict[str, str | int]]], embeddings: np.ndarray):
+        if self.__projection is None:
+            self.__store(records, embeddings)
+        elif self.__projection.is_trained:
+            self.__store(records, self.__projection.apply(embeddings))
+        else:
+            # records wait on disk until save() or search(), so the projection is trained on a sample of all of them
+            with open(self.__pending_records_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(record) + "\n" for record in records)
+            self.__pending.append(embeddings)
+
+    def __flush_pending(self):
+        if self.__pending is None or len(self.__pending) == 0: return
+
+        batch_size = 4096
+        batches = zip(self.__pending_record_batches(batch_size), self.__pending.batches(batch_size))
+
+        if self.__projection.can_train(len(self.__pending)):
+            self.__projection.train(self.__pending.sample)
+            self.__projection.save()
+            for records, embeddings in batches:
+                self.__store(records, self.__projection.apply(embeddings))
+        else:
+            # too few chunks to train the projection; the collection is still empty, so store full embeddings
+            print(f"Only {len(self.__pending)} embeddings, too few for a projection to "
+                  f"{self.__projection.output_dimension} dimensions. Storing full embeddings.")
+            for records, embeddings in batches:
+                self.__store(records, embeddings)
+            self.__projection = None
+            os.remove(self.__projection_path)
+
+        # cleared only once stored, so nothing is lost if training or storing fails
+        self.__pending.clear()
+        self.__pending = None
+        os.remove(self.__pending_records_path)
+
+    def save(self):
+        # chroma persists records by itself; this only trains the projection and stores records held back for it
+        self.__flush_pending()
+
+    def add_records(self, records: list[dict[str, str | dict[str, str | int]]], embedding_pool: EmbeddingPool = None,
+                    embeddings: np.ndarray = None):
+        # precomputed embeddings take precedence over the pool
+        if (embeddings is None and embedding_pool is None) or self.__built_in_embeddings:
+            for record in records:
+                self.add_record(record)
+            return
+
+        if not records: return
+
+        if embeddings is None:
+            embeddings = embedding_pool.embed_texts([record["chunk"] for record in records])
+
+        self.__add_embedded(records, np.asarray(embeddings, dtype=np.float32))
+
+    def close(self):
+        # drops chroma's cached system for this client so its memory can be freed once the index is released
+        self.__client.clear_system_cache()
 
     def search(self, query: str, k: int = 10):
 
-        if not self.__built_in_embeddings:
-            query = self.__embedder.embed_text(query)
+        if self.__built_in_embeddings:
+            return self.__query({"query_texts": [query]}, k)
+
+        return self.search_embedding(self.__embedder.embed_text(query), k)
+
+    def search_embedding(self, query_embedding: np.ndarray, k: int = 10):
+        # query embedded by the caller, e.g. once for many indexes; it goes through the same projection as stored vectors
+        if self.__built_in_embeddings:
+            raise ValueError("Searching by embedding isn't supported with built-in embeddings")
+
+        self.__flush_pending()
+
+        query_embedding = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+        if self.__projection is not None:
+            query_embedding = self.__projection.apply(query_embedding)
+
+        return self.__query({"query_embeddings": list(query_embedding)}, k)
 
+    def __query(self, query_arguments: dict, k: int):
         results = self.__collection.query(
-            query_texts=[query],
+            **query_arguments,
             n_results=k,
             include=[
                 IncludeEnum.documents,
@@ -4,6 +4,8 @@ import os
 import pickle
 from typing import List, Dict, Any, Optional, Union
 from embedder import Embedder
+from embedding_pool import EmbeddingPool
+from projection import Projection, PendingEmbeddings
 
 
 class FaissIndex:
@@ -11,7 +13,8 @@ class FaissIndex:
     A vector index implementation using FAISS.
     """
 
-    def __init__(self, embedder: Embedder, persist_directory: str = "faiss_database", debug: bool = False):
+    def __init__(self, embedder: Embedder, persist_directory: str = "faiss_database", debug: bool = False,
+                 projection_dimension: Optional[int] = None):
         """
         Initialize the FAISS index.
 
@@ -19,10 +22,13 @@ class FaissIndex:
             embedder: An instance of the Embedder class
             persist_directory: Directory where the index will be saved
             debug: Whether to print debug information
+            projection_dimension: Dimension to reduce embeddings to with PCA; only used when creating a new index,
+                an existing index keeps the projection it was saved with
         """
         self.__embedder: Embedder = embedder
         self.__persist_directory: str = persist_directory
         self.__debug: bool = debug
+        self.__projection_dimension: Optional[int] = projection_dimension
 
         # Create persist directory if it doesn't exist
         os.makedirs(persist_directory, exist_ok=True)
@@ -31,9 +37,13 @@ class FaissIndex:
         self.__index_path = os.path.join(persist_directory, "faiss_index.bin")
         self.__metadata_path = os.path.join(persist_directory, "metadata.pkl")
         self.__documents_path = os.path.join(persist_directory, "documents.pkl")
+        self.__projection_path = os.path.join(persist_directory, "projection.bin")
+        self.__pending_path = os.path.join(persist_directory, "pending_embeddings.f32")
 
         # Initialize or load index and related data
         self.__index = None
+        self.__projection: Optional[Projection] = None
+        self.__pending: Optional[PendingEmbeddings] = None  # full embeddings held back until the projection is trained
         self.__documents = []
         self.__metadatas = []
         self.__record_count = 0
@@ -58,6 +68,20 @@ class FaissIndex:
                 self.__metadatas = pickle.load(f)
 
             self.__record_count = len(self.__documents)
+
+            # Load the projection the index was built with
+            if os.path.exists(self.__projection_path):
+                self.__projection = Projection(0, 0, self.__projection_path, debug=self.__debug)
+
+            # A checkpoint taken before the projection was trained resumes with the embeddings held back so far;
+            # rows appended after the checkpoint belong to records it doesn't know about
+            if self.__projection is not None and not self.__projection.is_trained:
+                self.__pending = PendingEmbeddings(self.__pending_path, self.__projection.training_size)
+                count = min(len(self.__pending), self.__record_count)
+                self.__pending.truncate(count)
+                self.__documents = self.__documents[:count]
+                self.__metadatas = self.__metadatas[:count]
+                self.__record_count = count
         else:
             if self.__debug:
                 print(f"Creating new index in {self.__persist_directory}")
@@ -67,6 +91,14 @@ class FaissIndex:
             sample_embedding = self.__embedder.embed_text(sample_text)
             dimension = sample_embedding.shape[0]
 
+            # Vectors are stored reduced if a projection is requested
+            if self.__projection_dimension is not None:
+                self.__projection = Projection(dimension, self.__projection_dimension, self.__projection_path,
+                                               debug=self.__debug)
+                self.__pending = PendingEmbeddings(self.__pending_path, self.__projection.training_size)
+                self.__pending.clear()  # leftovers of an index that was never saved
+                dimension = self.__projection_dimension
+
             # Create a new FAISS index
             self.__index = faiss.IndexFlatIP(dimension)  # Inner product for cosine similarity
             self.__documents = []
@@ -82,6 +114,46 @@ class FaissIndex:
         """
         return self.__record_count
 
+    def __add_embeddings(self, embeddings: np.ndarray):
+        """
+        Add embeddings to the FAISS index, projecting them first if a projection is used.
+
+        Until the projection is trained, embeddings are held back in a file next to the index, so that
+        the projection is trained on a random sample of the whole repository when the index is saved or searched.
+        """
+        if self.__projection is None:
+            self.__index.add(embeddings)
+        elif self.__projection.is_trained:
+            self.__index.add(self.__projection.apply(embeddings))
+        else:
+            self.__pending.append(embeddings)
+
+    def __flush_pending_embeddings(self):
+        """Train the projection on a sample of everything held back and add the held back embeddings."""
+        if self.__pending is None or len(self.__pending) == 0:
+            return
+
+        if self.__projection.can_train(len(self.__pending)):
+            self.__projection.train(self.__pending.sample)
+            index = faiss.IndexFlatIP(self.__projection.output_dimension)
+            for batch in self.__pending.batches():
+                index.add(self.__projection.apply(batch))
+        else:
+            # Too few chunks to train the projection; nothing was added yet, so store full embeddings instead
+            print(f"Only {len(self.__pending)} embeddings, too few for a projection to "
+                  f"{self.__projection.output_dimension} dimensions. Storing full embeddings.")
+            index = faiss.IndexFlatIP(self.__pending.dimension)
+            for batch in self.__pending.batches():
+                index.add(batch)
+            self.__projection = None
+            if os.path.exists(self.__projection_path):
+                os.remove(self.__projection_path)
+
+        # Swapped in and cleared only once everything is added, so records stay in step
+        self.__index = index
+        self.__pending.clear()
+        self.__pending = None
+
     def add_record(self, record: Dict[str, Union[str, Dict[str, Union[str, int]]]]):
         """
         Add a record to the index.
@@ -110,7 +182,7 @@ class FaissIndex:
         embedding = np.float32(embedding).reshape(1, -1)
 
         # Add to FAISS index
-        self.__index.add(embedding)
+        self.__add_embeddings(embedding)
 
         # Store document and metadata
         self.__documents.append(chunk)
@@ -118,9 +190,44 @@ class FaissIndex:
 
         self.__record_count += 1
 
-        # Periodically save the index (optional)
+        # Periodically save the index (optional); held back embeddings are already on disk and stay held back
         if self.__record_count % 100 == 0:
-            self.save()
+            self.__write()
+
+    def add_records(self, records: List[Dict[str, Union[str, Dict[str, Union[str, int]]]]],
+                    embedding_pool: Optional[EmbeddingPool] = None, embeddings: Optional[np.ndarray] = None):
+        """
+        Add a batch of records to the index.
+
+        Args:
+            records: A list of dictionaries containing the chunk and metadata
+            embedding_pool: Pool used to embed the whole batch in parallel; records are added one by one if None
+            embeddings: Precomputed embeddings, one row per record; takes precedence over embedding_pool
+        """
+        if embeddings is None and embedding_pool is None:
+            for record in records:
+                self.add_record(record)
+            return
+
+        if not records:
+            return
+
+        if self.__debug:
+            print(f"Adding batch of {len(records)} records")
+
+        if embeddings is None:
+            embeddings = embedding_pool.embed_texts([record["chunk"] for record in records])
+
+        self.__add_embeddings(np.ascontiguousarray(embeddings, dtype=np.float32))
+
+        previous_count = self.__record_count
+        self.__documents.extend(record["chunk"] for record in records)
+        self.__metadatas.extend(record["metadata"] for record in records)
+        self.__record_count += len(records)
+
+        # Save whenever the batch crosses a multiple of 100, same as add_record
+        if self.__record_count // 100 > previous_count // 100:
+            self.__write()
 
     def search(self, query: str, k: int = 10) -> List[Dict[str, Any]]:
         """
@@ -139,9 +246,32 @@ class FaissIndex:
         # Get query embedding
         query_embedding = self.__embedder.embed_text(query)
 
+        return self.search_embedding(query_embedding, k)
+
+    def search_embedding(self, query_embedding: np.ndarray, k: int = 10) -> List[Dict[str, Any]]:
+        """
+        Search for documents similar to an already embedded query.
+
+        Args:
+            query_embedding: Full embedding of the query, as produced by the embedder
+            k: Number of results to return
+
+        Returns:
+            List of dictionaries containing search results
+        """
+        if self.__record_count == 0:
+            return []
+
+        # Make sure every record is searchable
+        self.__flush_pending_embeddings()
+
         # Convert to float32 and reshape for FAISS
         query_embedding = np.float32(query_embedding).reshape(1, -1)
 
+        # Queries go through the same projection as stored vectors
+        if self.__projection is not None:
+            query_embedding = self.__projection.apply(query_embedding)
+
         # Search
         distances, indices = self.__index.search(query_embedding, min(k, self.__record_count))
 
@@ -164,12 +294,19 @@ class FaissIndex:
         return results
 
     def save(self):
-        """Save the index and related data to disk."""
+        """Save the index and related data to disk, training the projection if it's still untrained."""
         if self.__debug:
             print(f"Saving index to {self.__persist_directory}")
 
-        # Save the FAISS index
+        self.__flush_pending_embeddings()
+        self.__write()
+
+    def __write(self):
+        """Write the index and related data to disk as they are, held back embeddings included."""
+        # Save the FAISS index and the projection it depends on
         faiss.write_index(self.__index, self.__index_path)
+        if self.__projection is not None:
+            self.__projection.save()
 
         # Save documents and metadata
         with open(self.__documents_path, 'wb') as f:
@@ -183,9 +320,11 @@ class FaissIndex:
         if self.__debug:
             print("Clearing index")
 
-        # Reinitialize the index
+        # Reinitialize the index; a trained projection is kept
         dimension = self.__index.d
         self.__index = faiss.IndexFlatIP(dimension)
+        if self.__pending is not None:
+            self.__pending.clear()
         self.__documents = []
         self.__metadatas = []
         self.__record_count = 0
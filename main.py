@@ -4,6 +4,7 @@ import sys
 from pipeline import *
 
 def main():
+    parse_arguments()
     preparation()  # deletion of old files
     repo_url_input()  # loop that waits for proper git url input
     clone_repo()  # tries to clone repo if exists
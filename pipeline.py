@@ -2,11 +2,13 @@ import sys
 import re
 import os
 
-from utilities import print_done, remove_directory
+from utilities import print_done, remove_directory, get_int_argument
 from chunker import Chunker, ChunkingMode
 from embedder import Embedder
+from embedding_pool import EmbeddingPool
 from index_chroma import ChromaIndex
 from index_faiss import FaissIndex
+from git_source import shallow_clone_or_fetch
 
 import git
 
@@ -16,25 +18,18 @@ ENCODING: str | None = "UTF-8"
 DEFAULT_INDEX: type(FaissIndex) | type(ChromaIndex) = ChromaIndex
 LOCAL_DB_PATH: str = "faiss_database" if DEFAULT_INDEX is FaissIndex else "chroma_index"
 
-debug: bool = "--debug" in sys.argv
-
-reset_db: bool = "--reset-db" in sys.argv
-
-SKIP_CLONING: bool = "--skip-cloning" in sys.argv and os.path.exists(LOCAL_REPO_PATH)
-if "--skip-cloning" in sys.argv: print("Cloning will be skipped" if SKIP_CLONING else "Cloning won't be skipped")
-SKIP_INDEXING: bool = "--skip-indexing" in sys.argv and not reset_db and os.path.exists(LOCAL_DB_PATH)  # todo skip cloning dependant?
-if "--skip-indexing" in sys.argv: print("Indexing will be skipped" if SKIP_INDEXING else "Indexing won't be skipped")
-PRINT_RECORD_COUNT: bool = "--print-record-count" in sys.argv
-if "--faiss" in sys.argv:
-    os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
-    INDEX = FaissIndex
-elif "--chroma" in sys.argv:
-    INDEX = ChromaIndex
-else:
-    INDEX = DEFAULT_INDEX  # todo maybe another later
-print(f"{"FAISS" if INDEX is FaissIndex else "Chroma"} will be used as index")
-BUILT_IN_EMBEDDINGS: bool = "--built-in-embeddings" in sys.argv and INDEX is ChromaIndex
-if BUILT_IN_EMBEDDINGS: print("Built-in embeddings activated")
+# set from command line arguments by parse_arguments()
+debug: bool = False
+reset_db: bool = False
+SKIP_CLONING: bool = False
+SKIP_INDEXING: bool = False
+PRINT_RECORD_COUNT: bool = False
+GIT_OBJECTS: bool = False
+INDEX: type(FaissIndex) | type(ChromaIndex) = DEFAULT_INDEX
+BUILT_IN_EMBEDDINGS: bool = False
+EMBEDDING_WORKERS: int = 0
+PROJECTION_DIMENSION: int | None = None
+INDEXING_BATCH_SIZE: int = 512  # how many chunks are embedded at once when embedding workers are used
 
 # repo_url: str = ""  # change to whatever repo you need to skip repo url entering
 repo_url: str = "https://github.com/viarotel-org/escrcpy.git"
@@ -47,10 +42,42 @@ chunk_overlap: int = 240  # (only for CHARS chunking mode) how many chars are go
 chunk_all_files: bool = True
 
 
+def parse_arguments() -> None:
+    # called by entry points rather than at import, so processes that only import this module
+    # (e.g. embedding workers re-importing the main script) don't parse and print everything again
+    global debug, reset_db, SKIP_CLONING, SKIP_INDEXING, PRINT_RECORD_COUNT, GIT_OBJECTS, INDEX
+    global BUILT_IN_EMBEDDINGS, EMBEDDING_WORKERS, PROJECTION_DIMENSION
+
+    debug = "--debug" in sys.argv
+
+    reset_db = "--reset-db" in sys.argv
+
+    SKIP_CLONING = "--skip-cloning" in sys.argv and os.path.exists(LOCAL_REPO_PATH)
+    if "--skip-cloning" in sys.argv: print("Cloning will be skipped" if SKIP_CLONING else "Cloning won't be skipped")
+    SKIP_INDEXING = "--skip-indexing" in sys.argv and not reset_db and os.path.exists(LOCAL_DB_PATH)  # todo skip cloning dependant?
+    if "--skip-indexing" in sys.argv: print("Indexing will be skipped" if SKIP_INDEXING else "Indexing won't be skipped")
+    PRINT_RECORD_COUNT = "--print-record-count" in sys.argv
+    GIT_OBJECTS = "--git-objects" in sys.argv
+    if GIT_OBJECTS: print("Files will be read from git objects of a shallow clone")
+    if "--faiss" in sys.argv:
+        os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+        INDEX = FaissIndex
+    elif "--chroma" in sys.argv:
+        INDEX = ChromaIndex
+    else:
+        INDEX = DEFAULT_INDEX  # todo maybe another later
+    print(f"{"FAISS" if INDEX is FaissIndex else "Chroma"} will be used as index")
+    BUILT_IN_EMBEDDINGS = "--built-in-embeddings" in sys.argv and INDEX is ChromaIndex
+    if BUILT_IN_EMBEDDINGS: print("Built-in embeddings activated")
+    EMBEDDING_WORKERS = get_int_argument("--embedding-workers", 0) if not BUILT_IN_EMBEDDINGS else 0
+    if EMBEDDING_WORKERS: print(f"{EMBEDDING_WORKERS} embedding worker processes will be used for indexing")
+    PROJECTION_DIMENSION = get_int_argument("--projection-dimension") if not BUILT_IN_EMBEDDINGS else None
+    if PROJECTION_DIMENSION: print(f"Embeddings will be reduced to {PROJECTION_DIMENSION} dimensions")
+
 
 @print_done("Program preparation")
 def preparation() -> None:
-    if not SKIP_CLONING:
+    if not SKIP_CLONING and not GIT_OBJECTS:  # with git objects an existing clone is updated with fetch instead
         remove_directory(LOCAL_REPO_PATH)  # if we've cloned some repository before, we need to remove old repo
     if reset_db:
         remove_directory(LOCAL_DB_PATH)  # removes old chroma_database if enabled
@@ -61,7 +88,7 @@ def repo_url_input():
 
     global repo_url
 
-    while not re.fullmatch(r"https://github\.com/[\w-]+/[\w-]+\.git", repo_url):
+    while not (re.fullmatch(r"https://github\.com/[\w-]+/[\w-]+\.git", repo_url) or os.path.isdir(repo_url)):
         # todo more variations like ssh etc. if possible
         repo_url = input("Please enter the repo url (enter 'exit' to exit the loop): ").strip()
 
@@ -78,6 +105,9 @@ def clone_repo():
     global repo
 
     try:
+        if GIT_OBJECTS:
+            repo = shallow_clone_or_fetch(repo_url, LOCAL_REPO_PATH)
+            return  # bare on purpose, files are read from git objects
         repo = git.Repo.clone_from(repo_url, to_path=LOCAL_REPO_PATH)
     except git.CommandError:
         print("Failed to clone.")
@@ -100,13 +130,23 @@ def initialize_index():
     else:
         embedder = Embedder(debug=debug)
         index = INDEX(
-            embedding_model=embedder,
+            embedder,  # positional: FaissIndex names this parameter `embedder`, ChromaIndex `embedding_model`
             persist_directory=LOCAL_DB_PATH,
-            debug=debug
+            debug=debug,
+            projection_dimension=PROJECTION_DIMENSION
         )
     if PRINT_RECORD_COUNT: print(index.get_record_count())
 
 
+def repo_chunks(chunker: Chunker):
+    if not GIT_OBJECTS:
+        yield from chunker.chunk_repo(path=LOCAL_REPO_PATH)
+        return
+
+    with git.Repo(LOCAL_REPO_PATH) as local_repo:  # closing stops its `git cat-file --batch` process
+        yield from chunker.chunk_git_objects(local_repo, path=LOCAL_REPO_PATH)
+
+
 @print_done("Indexing")
 def index_files():
     if SKIP_INDEXING: return
@@ -120,8 +160,20 @@ def index_files():
         encoding=ENCODING,
         debug=debug,
     )
-    for chunk in chunker.chunk_repo(path=LOCAL_REPO_PATH):
-        index.add_record(chunk)
+    if not EMBEDDING_WORKERS:
+        for chunk in repo_chunks(chunker):
+            index.add_record(chunk)
+    else:
+        with EmbeddingPool(workers=EMBEDDING_WORKERS, debug=debug) as embedding_pool:
+            batch = []
+            for chunk in repo_chunks(chunker):
+                batch.append(chunk)
+                if len(batch) >= INDEXING_BATCH_SIZE:
+                    index.add_records(batch, embedding_pool)
+                    batch = []
+            index.add_records(batch, embedding_pool)
+
+    index.save()  # writes out the last records and the trained projection
 
 
 def user_query(query: str):
@@ -0,0 +1,175 @@
+import os
+
+import faiss
+import numpy as np
+
+
+class Projection:
+    """
+    PCA projection of embeddings to a lower dimension, stored next to the index it belongs to.
+    """
+
+    def __init__(self, input_dimension: int, output_dimension: int, path: str, training_size: int = 2048,
+                 debug: bool = False) -> None:
+        """
+        Create an untrained projection, or load the one saved at `path`.
+
+        Args:
+            input_dimension: Dimension of embeddings produced by the embedder
+            output_dimension: Dimension of stored vectors
+            path: File the trained transform is saved to
+            training_size: How many embeddings are sampled to train the PCA
+            debug: Whether to print debug information
+        """
+        self.__path: str = path
+        self.__training_size: int = training_size
+        self.__debug: bool = debug
+
+        if os.path.exists(path):
+            self.__transform = faiss.read_VectorTransform(path)
+        else:
+            self.__transform = faiss.PCAMatrix(input_dimension, output_dimension)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.__transform.is_trained
+
+    @property
+    def training_size(self) -> int:
+        return self.__training_size
+
+    @property
+    def output_dimension(self) -> int:
+        return self.__transform.d_out
+
+    def can_train(self, sample_count: int) -> bool:
+        # n centered samples span at most n - 1 dimensions, so more components would be noise
+        return sample_count > self.output_dimension
+
+    def train(self, embeddings: np.ndarray) -> None:
+        """Train the PCA on a random sample of `training_size` rows of embeddings."""
+        if not self.can_train(len(embeddings)):
+            raise ValueError(f"Projection to {self.output_dimension} dimensions needs more than "
+                             f"{self.output_dimension} embeddings to train, got {len(embeddings)}")
+
+        if len(embeddings) > self.__training_size:
+            sample = np.random.default_rng(0).choice(len(embeddings), self.__training_size, replace=False)
+            embeddings = embeddings[sample]
+
+        if self.__debug:
+            print(f"Training {self.__transform.d_in} -> {self.__transform.d_out} projection "
+                  f"on {len(embeddings)} embeddings")
+
+        self.__transform.train(np.ascontiguousarray(embeddings, dtype=np.float32))
+
+    def apply(self, embeddings: np.ndarray) -> np.ndarray:
+        return self.__transform.apply(np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+
+    def save(self) -> None:
+        # an untrained projection is saved too, so an index checkpointed before training can be resumed
+        faiss.write_VectorTransform(self.__transform, self.__path)
+
+
+class PendingEmbeddings:
+    """
+    Full-dimension embeddings waiting for a projection to be trained.
+
+    Rows are appended to a file next to the index (read back through np.memmap), so memory doesn't grow
+    with the repository; only a reservoir sample of `sample_size` rows is kept in memory to train on.
+    """
+
+    __header_dtype = np.dtype(np.int64)  # the file starts with the embedding dimension
+
+    def __init__(self, path: str, sample_size: int) -> None:
+        """
+        Create an empty buffer, or reopen the one left at `path` by a checkpointed index.
+
+        Args:
+            path: File the embeddings are spilled to
+            sample_size: How many rows the reservoir sample holds
+        """
+        self.__path: str = path
+        self.__sample_size: int = sample_size
+        self.__rng = np.random.default_rng(0)
+        self.__dimension: int = 0
+        self.__count: int = 0
+        self.__sample: np.ndarray | None = None
+
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                self.__dimension = int(np.frombuffer(f.read(self.__header_dtype.itemsize), self.__header_dtype)[0])
+            rows = (os.path.getsize(path) - self.__header_dtype.itemsize) // (self.__dimension * 4)
+            self.truncate(rows)
+
+    def __len__(self) -> int:
+        return self.__count
+
+    @property
+    def dimension(self) -> int:
+        return self.__dimension
+
+    @property
+    def sample(self) -> np.ndarray:
+        """Uniform random sample of every row appended so far (all of them while there are fewer than sample_size)."""
+        return self.__sample[:min(self.__count, self.__sample_size)]
+
+    def __add_to_sample(self, embeddings: np.ndarray) -> None:
+        if self.__sample is None:
+            self.__sample = np.empty((self.__sample_size, self.__dimension), dtype=np.float32)
+
+        # reservoir sampling: row number n replaces a random sample row with probability sample_size / (n + 1)
+        for row in embeddings:
+            if self.__count < self.__sample_size:
+                self.__sample[self.__count] = row
+            else:
+                slot = self.__rng.integers(0, self.__count + 1)
+                if slot < self.__sample_size:
+                    self.__sample[slot] = row
+            self.__count += 1
+
+    def append(self, embeddings: np.ndarray) -> None:
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        if len(embeddings) == 0:
+            return
+
+        if not os.path.exists(self.__path):
+            self.__dimension = embeddings.shape[1]
+            with open(self.__path, "wb") as f:
+                f.write(np.array([self.__dimension], dtype=self.__header_dtype).tobytes())
+
+        with open(self.__path, "ab") as f:
+            f.write(embeddings.tobytes())
+        self.__add_to_sample(embeddings)
+
+    def __read(self, count: int, batch_size: int):
+        if count == 0:
+            return
+
+        rows = np.memmap(self.__path, dtype=np.float32, mode="r", offset=self.__header_dtype.itemsize,
+                         shape=(count, self.__dimension))
+        for start in range(0, count, batch_size):
+            yield np.array(rows[start:start + batch_size])
+        del rows  # the file can't be removed on Windows while it's still mapped
+
+    def batches(self, batch_size: int = 4096):
+        """Yields appended rows in order, batch_size rows at a time."""
+        yield from self.__read(self.__count, batch_size)
+
+    def truncate(self, count: int) -> None:
+        """Keep only the first `count` rows, e.g. the ones an index checkpoint knows about, and rebuild the sample."""
+        if os.path.exists(self.__path):
+            with open(self.__path, "r+b") as f:
+                f.truncate(self.__header_dtype.itemsize + count * self.__dimension * 4)
+
+        self.__rng = np.random.default_rng(0)
+        self.__count = 0
+        self.__sample = None
+        for batch in self.__read(count, 4096):
+            self.__add_to_sample(batch)
+
+    def clear(self) -> None:
+        if os.path.exists(self.__path): os.remove(self.__path)
+        self.__rng = np.random.default_rng(0)
+        self.__dimension = 0
+        self.__count = 0
+        self.__sample = None
@@ -0,0 +1,226 @@
+import os
+import time
+
+import numpy as np
+
+import pipeline
+from pipeline import *
+from tester import load_test_data, recall_at_k, reciprocal_rank_at_k
+from utilities import get_directory_size
+
+
+SWEEP_DB_PATH: str = "sweep_databases"  # every configuration gets its own index directory inside
+EMBEDDING_BATCH_SIZE: int = 32  # batch size for in-process embedding (when --embedding-workers isn't passed)
+
+# grid to evaluate; LINES mode ignores chunk size and overlap, so it's run once per backend
+sweep_chunking_modes: list[ChunkingMode] = [ChunkingMode.LINES, ChunkingMode.CHARS]
+sweep_chunk_sizes: list[int] = [480, 720, 1200]
+sweep_chunk_overlaps: list[int] = [120, 240]
+sweep_backends: list[type(FaissIndex) | type(ChromaIndex)] = [FaissIndex, ChromaIndex]
+sweep_projection_dimensions: list[int | None] = [None, 128, 256]  # None stores full embeddings
+sweep_k_values: list[int] = [1, 5, 10]
+
+
+def chunking_configurations() -> list[tuple[ChunkingMode, int | None, int | None]]:
+    configurations = []
+    for mode in sweep_chunking_modes:
+        if mode == ChunkingMode.LINES:
+            configurations.append((mode, None, None))
+            continue
+
+        for size in sweep_chunk_sizes:
+            for overlap in sweep_chunk_overlaps:
+                if overlap >= size: continue  # Chunker would silently grow the chunk anyway
+                configurations.append((mode, size, overlap))
+    return configurations
+
+
+def relative_filename(filename: str) -> str:
+    # chunks carry the path of the local clone, test inputs are relative to the repo root
+    prefix = LOCAL_REPO_PATH.rstrip("/") + "/"
+    return filename[len(prefix):] if filename.startswith(prefix) else filename
+
+
+class EmbeddingCache:
+    """
+    Keeps embedding of every chunk text seen so far, so chunk sets that share chunks
+    (and every backend evaluated on the same chunk set) are embedded only once.
+    """
+
+    def __init__(self, embedder: Embedder, embedding_pool: EmbeddingPool = None) -> None:
+        self.__embedder = embedder
+        self.__embedding_pool = embedding_pool
+        self.__vectors: dict[str, np.ndarray] = {}
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        if not texts: return np.empty((0, 0), dtype=np.float32)
+
+        missing = list(dict.fromkeys(text for text in texts if text not in self.__vectors))
+
+        if missing:
+            if self.__embedding_pool is not None:
+                vectors = self.__embedding_pool.embed_texts(missing)
+            else:
+                vectors = np.concatenate([
+                    self.__embedder.embed_texts(missing[i:i + EMBEDDING_BATCH_SIZE])
+                    for i in range(0, len(missing), EMBEDDING_BATCH_SIZE)
+                ])
+            self.__vectors.update(zip(missing, vectors))
+
+        return np.stack([self.__vectors[text] for text in texts])
+
+
+def build_index(backend, directory: str, embedder: Embedder, records: list, embeddings: np.ndarray,
+                projection_dimension: int | None) -> dict:
+    remove_directory(directory)
+
+    start = time.perf_counter()
+    built_index = backend(embedder, persist_directory=directory, debug=pipeline.debug,
+                          projection_dimension=projection_dimension)
+    built_index.add_records(records, embeddings=embeddings)
+    built_index.save()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "index": built_index,
+        "indexing-time": elapsed,
+        "index-size": get_directory_size(directory),
+    }
+
+
+def embed_questions(embedder: Embedder, test_data: list) -> tuple[list[np.ndarray], float]:
+    # every index is queried with the same question embeddings, so query latency measures only the index lookup
+    embeddings = []
+    start = time.perf_counter()
+    for test_case in test_data:
+        embeddings.append(embedder.embed_text(test_case["question"]))
+    elapsed = time.perf_counter() - start
+
+    return embeddings, elapsed / max(1, len(test_data))
+
+
+def evaluate_index(built_index, test_data: list, question_embeddings: list[np.ndarray]) -> dict:
+    max_k = max(sweep_k_values)
+    recalls = {k: [] for k in sweep_k_values}
+    reciprocal_ranks = {k: [] for k in sweep_k_values}
+    latencies = []
+
+    for test_case, question_embedding in zip(test_data, question_embeddings):
+        start = time.perf_counter()
+        results = built_index.search_embedding(question_embedding, k=max_k)
+        latencies.append(time.perf_counter() - start)
+
+        retrieved_files = [relative_filename(result["filename"]) for result in results]
+        for k in sweep_k_values:
+            recalls[k].append(recall_at_k(retrieved_files, test_case["files"], k))
+            reciprocal_ranks[k].append(reciprocal_rank_at_k(retrieved_files, test_case["files"], k))
+
+    return {
+        "recall": {k: float(np.mean(values)) for k, values in recalls.items()},
+        "mrr": {k: float(np.mean(values)) for k, values in reciprocal_ranks.items()},
+        "query-latency": float(np.mean(latencies)),
+    }
+
+
+def setting_label(value: int | None, default: str = "-") -> str:
+    # None means the setting doesn't apply; 0 is a real value and is shown as such
+    return default if value is None else str(value)
+
+
+def print_comparison_table(rows: list[dict]) -> None:
+    header = (f"{'backend':<8} {'mode':<6} {'size':>5} {'overlap':>7} {'dim':>5} {'k':>3} {'recall@k':>9} {'MRR@k':>7} "
+              f"{'chunks':>7} {'embed s':>8} {'index s':>8} {'size MB':>8} {'query ms':>9}")
+    print(header)
+    print("-" * len(header))
+
+    for row in rows:
+        for k in sweep_k_values:
+            print(f"{row['backend']:<8} {row['mode']:<6} {setting_label(row['size']):>5} {setting_label(row['overlap']):>7} "
+                  f"{setting_label(row['dimension'], 'full'):>5} {k:>3} "
+                  f"{row['recall'][k]:>9.3f} {row['mrr'][k]:>7.3f} {row['chunks']:>7} "
+                  f"{row['embedding-time']:>8.1f} {row['indexing-time']:>8.1f} "
+                  f"{row['index-size'] / 2 ** 20:>8.1f} {row['query-latency'] * 1000:>9.1f}")
+
+
+def run_sweep():
+    test_data = load_test_data()
+
+    parse_arguments()  # settings parsed here are read as pipeline.<name>, the star import holds the defaults
+    preparation()  # deletion of old files
+    repo_url_input()  # loop that waits for proper git url input
+    clone_repo()  # cloned once and shared by every configuration
+
+    if FaissIndex in sweep_backends: os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+
+    sweep_embedder = Embedder(debug=pipeline.debug)
+    embedding_pool = None
+    if pipeline.EMBEDDING_WORKERS:
+        embedding_pool = EmbeddingPool(workers=pipeline.EMBEDDING_WORKERS, debug=pipeline.debug)
+    embedding_cache = EmbeddingCache(sweep_embedder, embedding_pool)
+    question_embeddings, question_embedding_time = embed_questions(sweep_embedder, test_data)
+    print(f"Embedded {len(test_data)} test questions: {question_embedding_time * 1000:.1f} ms per question "
+          f"(not included in query ms)")
+
+    # chunking and embedding happen once per chunking configuration, whatever the number of backends
+    chunk_sets = []
+    try:
+        for mode, size, overlap in chunking_configurations():
+            chunker = Chunker(
+                chunking_mode=mode,
+                chunk_size=chunk_size if size is None else size,
+                chunk_overlap=chunk_overlap if overlap is None else overlap,
+                embedder=sweep_embedder,
+                chunk_all_files=chunk_all_files,
+                encoding=ENCODING,
+                debug=pipeline.debug,
+            )
+            records = list(repo_chunks(chunker))
+
+            start = time.perf_counter()
+            embeddings = embedding_cache.embed([record["chunk"] for record in records])
+            embedding_time = time.perf_counter() - start
+
+            print(f"Chunked and embedded {mode.name} {setting_label(size)}/{setting_label(overlap)}: "
+                  f"{len(records)} chunks, {embedding_time:.1f}s")
+            chunk_sets.append((mode, size, overlap, records, embeddings, embedding_time))
+    finally:
+        if embedding_pool is not None: embedding_pool.close()
+
+    configurations = [
+        (backend, dimension, chunk_set)
+        for chunk_set in chunk_sets
+        for backend in sweep_backends
+        for dimension in sweep_projection_dimensions
+    ]
+
+    # configurations are built and queried one at a time, so indexing times and latencies aren't skewed
+    # by each other; every index is released before the next one is built
+    rows = []
+    for backend, dimension, (mode, size, overlap, records, embeddings, embedding_time) in configurations:
+        name = (f"{backend.__name__}-{mode.name}-{setting_label(size)}-{setting_label(overlap)}-"
+                f"{setting_label(dimension, 'full')}").lower()
+        built = build_index(backend, os.path.join(SWEEP_DB_PATH, name), sweep_embedder, records, embeddings,
+                            dimension)
+
+        rows.append({
+            "backend": "FAISS" if backend is FaissIndex else "Chroma",
+            "mode": mode.name,
+            "size": size,
+            "overlap": overlap,
+            "dimension": dimension,
+            "chunks": len(records),
+            "embedding-time": embedding_time,
+            "indexing-time": built["indexing-time"],
+            "index-size": built["index-size"],
+            **evaluate_index(built["index"], test_data, question_embeddings),
+        })
+
+        if isinstance(built["index"], ChromaIndex): built["index"].close()
+        del built
+
+    print()
+    print_comparison_table(rows)
+
+
+if __name__ == "__main__":
+    run_sweep()
@@ -14,9 +14,17 @@ def recall_at_k(retrieved, relevant, k=10):
     return hits / min(len(relevant), k)
 
 
+def reciprocal_rank_at_k(retrieved, relevant, k=10):
+    relevant_set = set(relevant)
+    for rank, item in enumerate(retrieved[:k], start=1):
+        if item in relevant_set: return 1 / rank
+    return 0
+
+
 def run_tests():
     test_data = load_test_data()
 
+    parse_arguments()
     preparation()  # deletion of old files
     repo_url_input()  # loop that waits for proper git url input
     clone_repo()  # tries to clone repo if exists
@@ -1,6 +1,7 @@
 import os
 import shutil
 import stat
+import sys
 
 def print_done(process_name: str):
     def decorator(func):
@@ -14,6 +15,14 @@ def print_done(process_name: str):
     return decorator
 
 
+def get_int_argument(name: str, default: int | None = None) -> int | None:
+    # reads `--name=value` from command line arguments
+    for arg in sys.argv:
+        if arg.startswith(f"{name}="):
+            return int(arg.split("=", 1)[1])
+    return default
+
+
 def on_remove_error(func, path, exc_info):
     os.chmod(path, stat.S_IWRITE)  # change to writable
     func(path)  # retry deletion
@@ -21,4 +30,12 @@ def on_remove_error(func, path, exc_info):
 
 def remove_directory(path: str) -> None:
     if not os.path.exists(path): return
-    shutil.rmtree(path, onerror=on_remove_error)  # removes content of directory with repository
\ No newline at end of file
+    shutil.rmtree(path, onerror=on_remove_error)  # removes content of directory with repository
+
+
+def get_directory_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            size += os.path.getsize(os.path.join(root, file))
+    return size